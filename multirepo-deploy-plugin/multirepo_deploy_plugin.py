@@ -1,7 +1,12 @@
 import importlib
-from datetime import datetime
+import os
+import shlex
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
+from weakref import WeakValueDictionary
 
 from airflow.configuration import conf
 from airflow.plugins_manager import AirflowPlugin
@@ -14,64 +19,242 @@ from flask import render_template, flash, redirect, request
 from flask_appbuilder import BaseView, expose
 from flask_wtf import FlaskForm
 from git import Repo
-from git.exc import InvalidGitRepositoryError
-from git.cmd import GitCommandError
+from git.db import GitCmdObjectDB
+from git.cmd import Git, GitCommandError
 from wtforms.fields import SelectField
 
 
 @dataclass
 class RepoMeta:
     folder: str
+    path: Path
     remotes: list
     active_branch: str
     sha: str
     commit_message: str
     author: str
     committed_date: int
+    committed_date_str: str
     local_branches: list
     remote_branches: list
-    repo: Repo
+
+    @property
+    def repo(self) -> Repo:
+        """A Repo handle opened on demand.
+
+        Deliberately not stored on the instance: cached RepoMeta objects would
+        otherwise pin GitPython's file descriptors and cat-file subprocesses
+        alive for every repo in the DAGs folder.
+        """
+        return _open_repo(self.path)
 
     @classmethod
-    def from_repo(cls, repo: Repo, folder: str):
-        try:
-            active_branch = repo.active_branch.name
-        except TypeError:
-            active_branch = None
+    def from_path(cls, path: Path, folder: str):
+        git_dir, common_dir = _resolve_git_dirs(path)
+        active_branch, sha = _read_head(git_dir, common_dir)
 
         try:
-            sha = repo.head.commit.hexsha
-            commit_message = repo.head.commit.message
-            author = repo.head.commit.author.name
-            committed_date = repo.head.commit.committed_date
-        except ValueError:
-            sha = None
+            author, committed_date, commit_message = (
+                Git(str(path)).log("-1", "--format=%an%x00%ct%x00%B").split("\x00", 2)
+            )
+            committed_date = int(committed_date)
+        except (ValueError, GitCommandError):
             commit_message = None
             author = None
             committed_date = None
 
+        local_branches, remote_branches = _read_branches(common_dir)
+
         return cls(
             folder=folder,
-            remotes=[(rem.name, rem.url) for rem in repo.remotes],
+            path=path,
+            remotes=_read_remotes(common_dir),
             active_branch=active_branch,
             sha=sha,
             commit_message=commit_message,
             author=author,
             committed_date=committed_date,
-            local_branches=[brn.name for brn in repo.branches],
-            remote_branches=[
-                ref.name for ref in repo.remotes.origin.refs if "HEAD" not in ref.name
-            ],
-            repo=repo,
+            committed_date_str=(
+                time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(committed_date))
+                if committed_date
+                else None
+            ),
+            local_branches=local_branches,
+            remote_branches=remote_branches,
         )
 
-    @property
-    def committed_date_str(self):
-        return (
-            datetime.fromtimestamp(self.committed_date).strftime("%Y-%m-%d %H:%M:%S")
-            if self.committed_date
-            else None
-        )
+
+_repo_meta_cache: dict[str, tuple[tuple, "RepoMeta"]] = {}
+# (dags_folder mtime, ready git env per keyed folder) — see DeploymentView._git_env
+_key_cache: tuple[int, dict] = (-1, {})
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="multirepo_deploy")
+_repo_registry: WeakValueDictionary = WeakValueDictionary()
+
+
+def _open_repo(path: Path) -> Repo:
+    """Share one Repo handle per folder for as long as anything holds it.
+
+    Weak values keep concurrent requests from each paying Repo() construction
+    without pinning the handle alive once the last request drops it.
+    """
+    key = str(path)
+    repo = _repo_registry.get(key)
+    if repo is None:
+        repo = Repo(path, odbt=GitCmdObjectDB, search_parent_directories=False)
+        _repo_registry[key] = repo
+    return repo
+
+
+def _repo_cache_key(path: Path) -> tuple:
+    """Cheap fingerprint of a repo's state built from stat calls alone.
+
+    Loose-ref updates are renames inside refs/heads or refs/remotes/<name>,
+    which touch only the immediate parent directory, so the whole refs tree
+    is walked and the newest mtime kept alongside HEAD and packed-refs.
+    """
+    git_dir, common_dir = _resolve_git_dirs(path)
+
+    key = []
+    for target in (git_dir.joinpath("HEAD"), common_dir.joinpath("packed-refs")):
+        try:
+            key.append(target.stat().st_mtime_ns)
+        except OSError:
+            key.append(0)
+
+    refs_mtime = 0
+    for dirpath, _dirnames, filenames in os.walk(common_dir.joinpath("refs")):
+        for entry in (dirpath, *(os.path.join(dirpath, name) for name in filenames)):
+            try:
+                refs_mtime = max(refs_mtime, os.stat(entry).st_mtime_ns)
+            except OSError:
+                pass
+    key.append(refs_mtime)
+
+    return tuple(key)
+
+
+def _resolve_git_dirs(path: Path) -> tuple[Path, Path]:
+    """(private git dir, common git dir) for a repo folder.
+
+    For a linked worktree the .git pointer file leads to the worktree-private
+    dir, which holds HEAD, while refs, packed-refs and config live in the
+    common dir named by its commondir file. For a regular clone both are
+    simply .git.
+    """
+    git_dir = path.joinpath(".git")
+    if git_dir.is_file():
+        target = git_dir.read_text().strip()
+        if target.startswith("gitdir: "):
+            git_dir = path.joinpath(target[len("gitdir: ") :])
+
+    common_dir = git_dir
+    commondir_file = git_dir.joinpath("commondir")
+    if commondir_file.exists():
+        common_dir = git_dir.joinpath(commondir_file.read_text().strip()).resolve()
+
+    return git_dir, common_dir
+
+
+def _read_head(git_dir: Path, common_dir: Path) -> tuple:
+    """(active branch, HEAD sha) straight from the .git files; either may be None.
+
+    HEAD itself is per worktree, but the branch ref it points at lives in the
+    common dir.
+    """
+    try:
+        head = git_dir.joinpath("HEAD").read_text().strip()
+    except OSError:
+        return None, None
+
+    if not head.startswith("ref: "):
+        # A detached HEAD holds the sha itself instead of a symbolic ref.
+        return None, head or None
+
+    refname = head[len("ref: ") :]
+    branch = (
+        refname[len("refs/heads/") :] if refname.startswith("refs/heads/") else None
+    )
+
+    loose = common_dir.joinpath(refname)
+    if loose.exists():
+        return branch, loose.read_text().strip()
+
+    packed_refs = common_dir.joinpath("packed-refs")
+    if packed_refs.exists():
+        with open(packed_refs) as refs_file:
+            for line in refs_file:
+                if line.startswith(("#", "^")):
+                    continue
+                sha, _, name = line.rstrip("\n").partition(" ")
+                if name == refname:
+                    return branch, sha
+
+    # Unborn branch: HEAD points at a ref that does not exist yet.
+    return branch, None
+
+
+def _read_remotes(git_dir: Path) -> list:
+    """Remote (name, url) pairs parsed from .git/config, without spawning git."""
+    remotes = []
+    config = git_dir.joinpath("config")
+    if not config.exists():
+        return remotes
+
+    section = None
+    for line in config.read_text().splitlines():
+        line = line.strip()
+        if line.startswith("["):
+            section = line
+        elif section and section.startswith('[remote "') and line.startswith("url"):
+            key, _, url = line.partition("=")
+            if key.strip() == "url":
+                remotes.append((section[len('[remote "') : -len('"]')], url.strip()))
+    return remotes
+
+
+def _read_branches(git_dir: Path) -> tuple[list, list]:
+    """Read local and origin branch names from .git directly, without spawning git.
+
+    Packed refs are read first, then overlaid with loose refs, mirroring how
+    git itself resolves them.
+    """
+    heads = set()
+    remotes = set()
+
+    packed_refs = git_dir.joinpath("packed-refs")
+    if packed_refs.exists():
+        with open(packed_refs) as refs_file:
+            for line in refs_file:
+                if line.startswith(("#", "^")):
+                    continue
+                _, _, refname = line.rstrip("\n").partition(" ")
+                if refname.startswith("refs/heads/"):
+                    heads.add(refname[len("refs/heads/") :])
+                elif refname.startswith("refs/remotes/origin/"):
+                    remotes.add(refname[len("refs/remotes/") :])
+
+    heads_root = git_dir.joinpath("refs", "heads")
+    for dirpath, _dirnames, filenames in os.walk(heads_root):
+        rel = Path(dirpath).relative_to(heads_root)
+        for name in filenames:
+            heads.add(str(rel.joinpath(name)))
+
+    origin_root = git_dir.joinpath("refs", "remotes", "origin")
+    for dirpath, _dirnames, filenames in os.walk(origin_root):
+        rel = Path(dirpath).relative_to(origin_root)
+        for name in filenames:
+            remotes.add(f"origin/{rel.joinpath(name)}")
+
+    return sorted(heads), sorted(brn for brn in remotes if "HEAD" not in brn)
+
+
+def get_allowed_branches() -> frozenset | None:
+    allowed_branches = conf.get("multirepo_deploy", "allowed_branches", fallback=None)
+    return (
+        frozenset(brn.strip() for brn in allowed_branches.split(","))
+        if allowed_branches
+        else None
+    )
 
 
 def get_post_hook():
@@ -84,11 +267,12 @@ def get_post_hook():
 
 
 class DeploymentView(BaseView):
-    dags_folder = conf.get("core", "dags_folder")
+    dags_folder = Path(conf.get("core", "dags_folder")).resolve()
 
     template_folder = Path(__file__).resolve().parent.joinpath("templates")
     route_base = "/deployment"
     post_hook = get_post_hook()
+    allowed_branches = get_allowed_branches()
 
     def render(self, template, **context):
         return render_template(
@@ -98,24 +282,59 @@ class DeploymentView(BaseView):
             **context,
         )
 
+    def _repo_path(self, folder: str) -> Path | None:
+        """The folder's path under dags_folder, or None if it escapes it.
+
+        The route converter lets folder contain slashes, so reject anything
+        that normalizes outside the DAGs folder. Normalization is lexical
+        (no resolve()) on purpose: repo folders are allowed to be symlinks.
+        """
+        repo_path = Path(os.path.normpath(self.dags_folder.joinpath(folder)))
+        if repo_path == self.dags_folder or not repo_path.is_relative_to(
+            self.dags_folder
+        ):
+            return None
+        return repo_path
+
     @staticmethod
     def _load_repo(path, folder) -> RepoMeta | bool:
+        path = Path(path)
+        git_dir = path.joinpath(".git")
+        # .git is a file (not a dir) for linked worktrees; _resolve_git_dir follows it.
+        if not (git_dir.joinpath("HEAD").exists() or git_dir.is_file()):
+            return False
+
+        cache_key = _repo_cache_key(path)
+        cached = _repo_meta_cache.get(folder)
+        if cached and cached[0] == cache_key:
+            return cached[1]
+
         try:
-            return RepoMeta.from_repo(Repo(path), folder)
+            repo_meta = RepoMeta.from_path(path, folder)
 
-        except InvalidGitRepositoryError:
+        except GitCommandError:
             return False
 
+        _repo_meta_cache[folder] = (cache_key, repo_meta)
+        return repo_meta
+
     @expose("/repos")
     @auth.has_access(((permissions.ACTION_CAN_READ, permissions.RESOURCE_VARIABLE),))
     @action_logging
     def list(self):
-        repos = list()
+        with os.scandir(self.dags_folder) as entries:
+            candidates = [
+                (Path(entry.path), entry.name)
+                for entry in entries
+                if not entry.name.startswith(".") and entry.is_dir()
+            ]
 
-        for f in Path(self.dags_folder).iterdir():
-            if f.is_dir() and f.name != ".git":
-                if repo := self._load_repo(f, f.name):
-                    repos.append(repo)
+        # Lazy on purpose: rows render while the remaining repos are still loading.
+        repos = (
+            repo
+            for repo in _executor.map(lambda c: self._load_repo(*c), candidates)
+            if repo
+        )
 
         return self.render_template("repos.html", repos=repos)
 
@@ -123,30 +342,28 @@ class DeploymentView(BaseView):
     @auth.has_access(((permissions.ACTION_CAN_READ, permissions.RESOURCE_CONNECTION),))
     @action_logging
     def status(self, folder):
-        repo_meta = self._load_repo(Path(self.dags_folder).joinpath(folder), folder)
+        repo_path = self._repo_path(folder)
+        repo_meta = self._load_repo(repo_path, folder) if repo_path else False
 
         if not repo_meta:
             flash(f"Folder {folder} is not a git repository", "error")
             return redirect("/deployment/repos")
 
-        for rem in repo_meta.repo.remotes:
-            try:
-                rem.fetch(prune=True, env=self._git_env(folder))
-            except GitCommandError as gexc:
-                flash(str(gexc), "error")
+        try:
+            repo_meta.repo.git.fetch(
+                "--all",
+                "--prune",
+                f"--jobs={min(8, len(repo_meta.remotes) or 1)}",
+                env=self._git_env(folder),
+            )
+        except GitCommandError as gexc:
+            flash(str(gexc), "error")
 
-        allowed_branches = conf.get(
-            "multirepo_deploy", "allowed_branches", fallback=None
-        )
-        branch_choices = (
-            [
-                (brn, brn)
-                for brn in repo_meta.remote_branches
-                if brn in allowed_branches.split(",")
-            ]
-            if allowed_branches
-            else [(brn, brn) for brn in repo_meta.remote_branches]
-        )
+        branch_choices = [
+            (brn, brn)
+            for brn in repo_meta.remote_branches
+            if self.allowed_branches is None or brn in self.allowed_branches
+        ]
 
         form = GitBranchForm()
         form.branches.choices = branch_choices
@@ -158,27 +375,43 @@ class DeploymentView(BaseView):
     @auth.has_access(((permissions.ACTION_CAN_EDIT, permissions.RESOURCE_CONNECTION),))
     @action_logging
     def deploy(self, folder):
-        repo = Repo(path=Path(self.dags_folder).joinpath(folder))
+        repo_path = self._repo_path(folder)
+        repo_meta = self._load_repo(repo_path, folder) if repo_path else False
+
+        if not repo_meta:
+            flash(f"Folder {folder} is not a git repository", "error")
+            return redirect("/deployment/repos")
 
         new_branch = request.form.get("branches")
         new_local_branch = "/".join(new_branch.split("/")[1:])
 
-        git_env = self._git_env(folder)
+        git = f"git -C {shlex.quote(str(repo_path))}"
+        branch = shlex.quote(new_local_branch)
+
+        proc = subprocess.run(
+            f"{git} checkout {branch}"
+            f" && {git} fetch origin {branch}"
+            f" && {git} reset --hard origin/{branch}",
+            shell=True,
+            env={**os.environ, **self._git_env(folder)},
+            capture_output=True,
+            text=True,
+        )
 
-        try:
-            repo.git.checkout(new_local_branch, env=git_env)
-            repo.remotes.origin.fetch(env=git_env)
-            result = repo.git.reset("--hard", f"origin/{new_local_branch}", env=git_env)
-            if new_local_branch == repo.active_branch.name:
-                flash(f"Successfully updated branch: {new_local_branch}\n{result}")
-            else:
-                flash(f"Successfully changed to branch: {new_local_branch}\n{result}")
-        except GitCommandError as gexc:
-            flash(str(gexc), "error")
+        if proc.returncode:
+            flash(proc.stderr.strip() or proc.stdout.strip(), "error")
+        elif new_local_branch == repo_meta.active_branch:
+            flash(f"Successfully updated branch: {new_local_branch}\n{proc.stdout}")
+        else:
+            flash(f"Successfully changed to branch: {new_local_branch}\n{proc.stdout}")
+
+        # A reset --hard to the same branch may leave the cache key unchanged.
+        _repo_meta_cache.pop(folder, None)
+        _repo_registry.pop(str(repo_path), None)
 
         if DeploymentView.post_hook:
             try:
-                res = DeploymentView.post_hook(Path(self.dags_folder).joinpath(folder))
+                res = DeploymentView.post_hook(repo_path)
                 flash(f"Successfully ran post hook: {res}")
             except Exception as e:
                 flash(f"Failed to run post hook: {e}", "error")
@@ -186,13 +419,19 @@ class DeploymentView(BaseView):
         return redirect("/deployment/repos")
 
     def _git_env(self, folder: str) -> dict:
-        git_identity_file = Path(self.dags_folder).joinpath(f"{folder}.key")
-
-        return (
-            {"GIT_SSH_COMMAND": f"ssh -i {git_identity_file}"}
-            if Path(git_identity_file).exists()
-            else {}
-        )
+        global _key_cache
+
+        mtime = os.stat(self.dags_folder).st_mtime_ns
+        if mtime != _key_cache[0]:
+            _key_cache = (
+                mtime,
+                {
+                    key_file.stem: {"GIT_SSH_COMMAND": f"ssh -i {key_file}"}
+                    for key_file in self.dags_folder.glob("*.key")
+                },
+            )
+
+        return _key_cache[1].get(folder, {})
 
 
 deployment_view = DeploymentView()